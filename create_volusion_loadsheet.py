@@ -1,21 +1,88 @@
 import pandas as pd
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-import chardet
+try:
+    import cchardet as chardet  # faust-cchardet: compiled, much faster detection
+except ImportError:
+    import chardet
+try:
+    import pyarrow  # enables the multithreaded pyarrow CSV reader and Arrow-backed strings
+    import pyarrow.csv as pa_csv
+    CSV_ENGINE = 'pyarrow'
+    STRING_DTYPE = 'string[pyarrow]'
+except ImportError:
+    CSV_ENGINE = 'c'
+    STRING_DTYPE = 'string'
 import threading
+import queue
 import os
+import mmap
 import re
 from html import unescape
 
+# Loadsheet placeholders: MISSING_VALUE for empty output cells, DEFAULT_CATEGORY for
+# products without a category at the target depth
+MISSING_VALUE = "#N/A"
+DEFAULT_CATEGORY = "Other"
+
 processed_df = None
 category_mapping = {}   # categoryid -> categoryname
 parent_mapping = {}     # categoryid -> parentid
 product_file_path = None
+product_df = None       # parsed product CSV, reused by processing until a new file is selected
+ui_queue = queue.Queue()  # UI updates from worker threads, applied on the Tk thread by drain_ui_queue
 
 def shorten_filename(path, max_length=50):
     filename = os.path.basename(path)
     return filename if len(filename) <= max_length else "..." + filename[-(max_length - 3):]
 
+# --- Detect file encoding from a bounded sample instead of the whole file ---
+# (sample_size=None inspects the whole file)
+def detect_encoding(path, sample_size=65536):
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return 'utf-8'  # mmap cannot map an empty file
+        # Memory-map the file so only the sampled pages are read from disk
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            raw_data = mapped[:sample_size]
+    try:
+        raw_data.decode('ascii')
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return chardet.detect(raw_data)['encoding']
+
+# --- Read a CSV with the sampled encoding, re-detecting from the whole file if that guess fails ---
+def read_csv_with_detected_encoding(path, reader):
+    try:
+        return reader(path, detect_encoding(path))
+    except UnicodeDecodeError:
+        # An ASCII-only sample is read as UTF-8, but e.g. Windows-1252 "°" may appear further in
+        return reader(path, detect_encoding(path, sample_size=None))
+
+# --- Apply queued UI updates on the Tk thread ---
+# Messages: ('config', widget, options), ('error', title, message), ('call', func)
+def drain_ui_queue():
+    try:
+        while True:
+            try:
+                kind, *args = ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'config':
+                widget, options = args
+                widget.config(**options)
+            elif kind == 'error':
+                messagebox.showerror(*args)
+            elif kind == 'call':
+                args[0]()
+    finally:
+        # Always reschedule, so one failing update can't stop all later ones
+        root.after(50, drain_ui_queue)
+
+def hide_progress():
+    progress_bar.stop()
+    progress_bar.pack_forget()
+
 def update_buttons_state():
     if product_file_path and category_mapping:
         process_button.config(state=tk.NORMAL)
@@ -24,6 +91,11 @@ def update_buttons_state():
         save_button.config(state=tk.DISABLED)
 
 # --- Load Category CSV and build mappings ---
+CATEGORY_DTYPES = {'categoryid': str, 'parentid': str}
+
+def read_category_csv(file_path, encoding):
+    return pd.read_csv(file_path, encoding=encoding, dtype=CATEGORY_DTYPES, low_memory=False, memory_map=True)
+
 def load_category_file():
     global category_mapping, parent_mapping
     file_path = filedialog.askopenfilename(title="Select Category CSV", filetypes=[("CSV files", "*.csv")])
@@ -41,18 +113,13 @@ def load_category_file():
         parent_mapping = {}
 
         try:
-            with open(file_path, 'rb') as f:
-                raw_data = f.read()
-                encoding = chardet.detect(raw_data)['encoding']
-
-            cat_df = pd.read_csv(file_path, encoding=encoding, low_memory=False)
+            cat_df = read_csv_with_detected_encoding(file_path, read_category_csv)
 
             required_cols = ['categoryid', 'categoryname', 'parentid']
             missing_cols = set(required_cols) - set(cat_df.columns)
             if missing_cols:
-                root.after(0, lambda: messagebox.showerror(
-                    "Category File Error", f"Missing column(s): {', '.join(missing_cols)}"))
-                root.after(0, lambda: status_label.config(text="Invalid category file."))
+                ui_queue.put(('error', "Category File Error", f"Missing column(s): {', '.join(missing_cols)}"))
+                ui_queue.put(('config', status_label, {'text': "Invalid category file."}))
                 return
 
             # Ensure all IDs are strings
@@ -62,20 +129,15 @@ def load_category_file():
             category_mapping = dict(zip(cat_df['categoryid'], cat_df['categoryname']))
             parent_mapping = dict(zip(cat_df['categoryid'], cat_df['parentid']))
 
-            root.after(0, lambda: category_filename_label.config(text=f"Category File: {shorten_filename(file_path)}"))
-            root.after(0, lambda: status_label.config(text="Category file loaded successfully."))
-            root.after(0, update_buttons_state)
+            ui_queue.put(('config', category_filename_label, {'text': f"Category File: {shorten_filename(file_path)}"}))
+            ui_queue.put(('config', status_label, {'text': "Category file loaded successfully."}))
+            ui_queue.put(('call', update_buttons_state))
 
         except Exception as e:
-            root.after(0, lambda: [
-                messagebox.showerror("Category File Error", f"Failed to load category file:\n{e}"),
-                status_label.config(text="Error loading category file.")
-            ])
+            ui_queue.put(('error', "Category File Error", f"Failed to load category file:\n{e}"))
+            ui_queue.put(('config', status_label, {'text': "Error loading category file."}))
         finally:
-            root.after(0, lambda: [
-                progress_bar.stop(),
-                progress_bar.pack_forget()
-            ])
+            ui_queue.put(('call', hide_progress))
 
     threading.Thread(target=worker, daemon=True).start()
 
@@ -90,86 +152,152 @@ def get_category_depth(cat_id):
         depth += 1
     return depth + 1  # include current category
 
-# --- Get category at specific depth (fallback to depth-1 if not exist) ---
-def get_category_by_depth(ids_str, target_depth):
-    if not isinstance(ids_str, str):
-        return "Other"
-    ids = [id_.strip() for id_ in ids_str.split(',') if id_.strip()]
-    # First, try exact target depth
-    for id_ in ids:
-        if id_ in category_mapping:
-            depth = get_category_depth(id_)
-            if depth == target_depth:
-                return category_mapping[id_]
-    # Fallback: target depth - 1
-    for id_ in ids:
-        if id_ in category_mapping:
-            depth = get_category_depth(id_)
-            if depth == target_depth - 1:
-                return category_mapping[id_]
-    return "Other"
+# --- Get category at specific depth for every row (fallback to depth-1 if not exist) ---
+def get_category_by_depth(ids, target_depth):
+    if not (pd.api.types.is_object_dtype(ids) or pd.api.types.is_string_dtype(ids)):
+        return pd.Series(DEFAULT_CATEGORY, index=ids.index)
+    depths = {id_: get_category_depth(id_) for id_ in category_mapping}
+    # One row per (product, category id), keeping only known categories in their original order
+    exploded = ids.str.split(',').explode().str.strip()
+    exploded = exploded[exploded.isin(list(depths))]
+    exploded_depth = exploded.map(depths)
+    # First, try exact target depth; fallback: target depth - 1
+    exact = exploded[exploded_depth == target_depth].groupby(level=0).first()
+    fallback = exploded[exploded_depth == target_depth - 1].groupby(level=0).first()
+    return exact.combine_first(fallback).map(category_mapping).reindex(ids.index, fill_value=DEFAULT_CATEGORY)
+
+# --- Read the product CSV, using the pyarrow engine when installed ---
+# Product columns used by processing; everything else in the Volusion export is skipped
+PRODUCT_COLUMNS = [
+    'productcode', 'productname', 'ischildofproductcode', 'productprice',
+    'length', 'width', 'height', 'productweight', 'productdescriptionshort',
+    'photourl', 'producturl', 'categoryids'
+]
+# Text columns read as strings up front, Arrow-backed when pyarrow is installed
+# (no type inference; codes like "00123" stay intact).
+# productprice is left to inference and coerced later so malformed prices don't fail the parse.
+PRODUCT_DTYPES = {
+    'productcode': STRING_DTYPE, 'productname': STRING_DTYPE, 'ischildofproductcode': STRING_DTYPE,
+    'productdescriptionshort': STRING_DTYPE, 'photourl': STRING_DTYPE, 'producturl': STRING_DTYPE,
+    'categoryids': STRING_DTYPE
+}
+
+# pandas' default na_values, passed to pyarrow so both readers treat the same cells as blank
+# (pyarrow's own defaults do not include "None" or "<NA>")
+PANDAS_NA_VALUES = [
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'
+]
+
+def read_product_csv(file_path, encoding):
+    header = pd.read_csv(file_path, encoding=encoding, nrows=0).columns
+    usecols = [col for col in header if col in PRODUCT_COLUMNS]
+    dtype = {col: PRODUCT_DTYPES[col] for col in usecols if col in PRODUCT_DTYPES}
+    if CSV_ENGINE == 'pyarrow':
+        # pyarrow is called directly rather than via read_csv(engine='pyarrow'): that engine casts
+        # columns missing from a partial dtype map to numpy ints, which fails on blank
+        # length/width cells. Text columns are parsed as strings here so codes keep their padding.
+        # pyarrow is also stricter than the C engine: short/ragged rows raise ArrowInvalid
+        # instead of being padded with NaN, so fall back to the C engine for those files.
+        try:
+            # Memory-mapped like the C-engine read below
+            with pyarrow.memory_map(file_path) as source:
+                table = pa_csv.read_csv(
+                    source,
+                    read_options=pa_csv.ReadOptions(encoding=encoding),
+                    convert_options=pa_csv.ConvertOptions(
+                        include_columns=usecols,
+                        column_types={col: pyarrow.string() for col in dtype},
+                        null_values=PANDAS_NA_VALUES,
+                        strings_can_be_null=True
+                    )
+                )
+            # Columns pyarrow infers itself come back as binary when they are not valid in the
+            # given encoding (e.g. a Windows-1252 "1½ lb" weight after an ASCII-only sample).
+            # Raise so read_csv_with_detected_encoding re-detects from the whole file.
+            for field in table.schema:
+                if pyarrow.types.is_binary(field.type) or pyarrow.types.is_large_binary(field.type):
+                    raise UnicodeDecodeError(encoding, b'', 0, 0, f"column '{field.name}' is not valid {encoding}")
+            return table.to_pandas().astype(dtype)
+        except pyarrow.ArrowInvalid:
+            pass
+    return pd.read_csv(file_path, encoding=encoding, usecols=usecols, dtype=dtype, low_memory=False, memory_map=True)
+
+# --- Format numeric prices as "$1,234.56" ---
+def format_currency(prices):
+    # A product file has few distinct prices, so format each one once (keeping the exact
+    # f-string rounding) and map the results back instead of formatting every row
+    formatted = {price: f"${price:,.2f}" for price in prices.dropna().unique()}
+    return prices.map(formatted).fillna("")
+
+# --- Clean HTML descriptions (patterns compiled once, not per row) ---
+HTML_TAG_RE = re.compile(r'<[^>]+>')
+CONTROL_CHAR_RE = re.compile(r'[\x00-\x1f\x7f-\x9f]')
+DISALLOWED_CHAR_RE = re.compile(r"[^a-zA-Z0-9\s.,;:!?(){}\[\]\-_'\"&/%+°•$@]")
+WHITESPACE_RE = re.compile(r'\s+')
+
+def clean_description(text):
+    if pd.isna(text):
+        return ""
+    text = unescape(text)
+    text = HTML_TAG_RE.sub('', text)
+    text = CONTROL_CHAR_RE.sub('', text)
+    text = DISALLOWED_CHAR_RE.sub("", text)
+    text = WHITESPACE_RE.sub(' ', text)
+    return text.strip()
 
 # --- Process Product CSV ---
-def _process_file_worker(file_path):
+def _process_file_worker(df):
     global processed_df
 
-    def clean_description(text):
-        if pd.isna(text):
-            return ""
-        text = unescape(text)
-        text = re.sub(r'<[^>]+>', '', text)
-        text = re.sub(r'[\x00-\x1f\x7f-\x9f]', '', text)
-        text = re.sub(r"[^a-zA-Z0-9\s.,;:!?(){}\[\]\-_'\"&/%+°•$@]", "", text)
-        text = re.sub(r'\s+', ' ', text)
-        return text.strip()
-
     try:
-        with open(file_path, 'rb') as f:
-            raw_data = f.read()
-            encoding = chardet.detect(raw_data)['encoding']
-
-        df = pd.read_csv(file_path, encoding=encoding, low_memory=False)
-
-        required_cols = ['productcode', 'productname', 'ischildofproductcode']
-        missing_cols = set(required_cols) - set(df.columns)
-        if missing_cols:
-            raise ValueError(f"Missing required column(s): {', '.join(missing_cols)}")
+        # Map parent product titles (Series.map needs unique codes; last duplicate wins)
+        productcode_to_title = df.drop_duplicates('productcode', keep='last').set_index('productcode')['productname']
+        parent_titles = df['ischildofproductcode'].map(productcode_to_title)
 
-        # Map parent product titles
-        productcode_to_title = df.set_index('productcode')['productname'].to_dict()
-        df['Parent Title'] = df['ischildofproductcode'].map(productcode_to_title)
-
-        # Remove child products from main list
-        child_product_codes = df['ischildofproductcode'].dropna().unique()
-        df = df[~df['productcode'].isin(child_product_codes)]
+        # Remove child products from main list. Filtering returns a new frame, so the
+        # cached product_df is never modified and can be processed again.
+        df = df[~df['productcode'].isin(df['ischildofproductcode'].dropna())]
+        df['Parent Title'] = parent_titles
 
         # Format price
         if 'productprice' in df.columns:
-            df['productprice'] = pd.to_numeric(df['productprice'], errors='coerce') \
-                .map(lambda x: f"${x:,.2f}" if pd.notnull(x) else "")
+            prices = df['productprice']
+            if not pd.api.types.is_numeric_dtype(prices):
+                prices = pd.to_numeric(prices, errors='coerce')
+            df['productprice'] = format_currency(prices)
 
         # Assign Category (Depth 3 preferred, fallback = "Other")
         if 'categoryids' in df.columns and category_mapping:
-            df['Category'] = df['categoryids'].map(lambda x: get_category_by_depth(x, 3))
+            df['Category'] = get_category_by_depth(df['categoryids'], 3)
         else:
-            df['Category'] = "Other"
+            df['Category'] = DEFAULT_CATEGORY
 
         # Clean descriptions
         if 'productdescriptionshort' in df.columns:
-            df['productdescriptionshort'] = df['productdescriptionshort'].map(clean_description)
+            # Variants often share a description, so clean each distinct text only once
+            descriptions = df['productdescriptionshort']
+            cleaned = {text: clean_description(text) for text in descriptions.dropna().unique()}
+            df['productdescriptionshort'] = descriptions.map(cleaned).fillna("")
 
-        # Prepare final column list
-        final_variant_list = df.copy()
+        # Prepare final column list (select and add missing columns in one allocation)
         final_column_list = [
             'productcode', 'productname', 'ischildofproductcode', 'Parent Title',
             'productprice', 'length', 'width', 'height', 'productweight',
             'productdescriptionshort', 'photourl', 'producturl', 'Category'
         ]
-        for col in final_column_list:
-            if col not in final_variant_list.columns:
-                final_variant_list[col] = ""
+        final_variant_list = df.reindex(columns=final_column_list, fill_value=MISSING_VALUE)
 
-        final_variant_list = final_variant_list[final_column_list]
+        # --- Fill empty fields with proper defaults ---
+        # Treat empty, NaN, or whitespace-only as "Other" for Category and "#N/A" elsewhere.
+        # Columns missing from the product file were already filled with "#N/A" by reindex.
+        for col in final_column_list:
+            if col not in df.columns:
+                continue
+            default = DEFAULT_CATEGORY if col == "Category" else MISSING_VALUE
+            values = final_variant_list[col]
+            text = values.astype(str).str.strip()
+            final_variant_list[col] = text.where(values.notna() & text.ne(""), default)
 
         # Rename columns
         final_variant_list.rename(columns={
@@ -186,40 +314,28 @@ def _process_file_worker(file_path):
             'producturl': 'Product Link'
         }, inplace=True)
 
-        # --- Fill empty fields with proper defaults ---
-        for col in final_variant_list.columns:
-            if col == "Category":
-            # Treat empty, NaN, or whitespace-only as Other
-                final_variant_list[col] = final_variant_list[col].apply(lambda x: "Other" if pd.isna(x) or str(x).strip() == "" else str(x).strip())
-            else:
-             # Treat empty, NaN, or whitespace-only as "#N/A"
-                final_variant_list[col] = final_variant_list[col].apply(lambda x: "#N/A" if pd.isna(x) or str(x).strip() == "" else str(x).strip())
-
         processed_df = final_variant_list
 
-        root.after(0, lambda: [
-            status_label.config(text="Processing complete. You may now save the file."),
-            save_button.config(state=tk.NORMAL),
-            progress_bar.stop(),
-            progress_bar.pack_forget()
-        ])
+        ui_queue.put(('config', status_label, {'text': "Processing complete. You may now save the file."}))
+        ui_queue.put(('config', save_button, {'state': tk.NORMAL}))
+        ui_queue.put(('call', hide_progress))
 
     except Exception as e:
-        root.after(0, lambda: [
-            status_label.config(text=f"Error: {e}"),
-            messagebox.showerror("Processing Error", str(e)),
-            save_button.config(state=tk.DISABLED),
-            progress_bar.stop(),
-            progress_bar.pack_forget()
-        ])
+        ui_queue.put(('config', status_label, {'text': f"Error: {e}"}))
+        ui_queue.put(('error', "Processing Error", str(e)))
+        ui_queue.put(('config', save_button, {'state': tk.DISABLED}))
+        ui_queue.put(('call', hide_progress))
 
 # --- GUI Functions ---
 def select_product_file():
-    global product_file_path
+    global product_file_path, product_df
     file_path = filedialog.askopenfilename(title="Select Product CSV", filetypes=[("CSV files", "*.csv")])
     if not file_path:
         return
 
+    product_file_path = None
+    product_df = None
+
     category_button.config(state=tk.DISABLED)
     process_button.config(state=tk.DISABLED)
     save_button.config(state=tk.DISABLED)
@@ -229,42 +345,35 @@ def select_product_file():
     status_label.config(text="Loading product file...")
 
     def worker():
-        global product_file_path
+        global product_file_path, product_df
         try:
-            with open(file_path, 'rb') as f:
-                raw_data = f.read()
-                encoding = chardet.detect(raw_data)['encoding']
-            df = pd.read_csv(file_path, encoding=encoding, low_memory=False)
+            # Parse once here; processing reuses the cached frame
+            df = read_csv_with_detected_encoding(file_path, read_product_csv)
 
             required_cols = ['productcode', 'productname', 'ischildofproductcode']
             missing_cols = set(required_cols) - set(df.columns)
             if missing_cols:
-                root.after(0, lambda: messagebox.showerror(
-                    "Invalid Product File", f"Missing column(s): {', '.join(missing_cols)}"))
-                root.after(0, lambda: status_label.config(text="Invalid product file."))
+                ui_queue.put(('error', "Invalid Product File", f"Missing column(s): {', '.join(missing_cols)}"))
+                ui_queue.put(('config', status_label, {'text': "Invalid product file."}))
                 return
 
             product_file_path = file_path
-            root.after(0, lambda: product_filename_label.config(text=f"Product File: {shorten_filename(file_path)}"))
-            root.after(0, lambda: status_label.config(text="Product file loaded. Now select category file."))
-            root.after(0, lambda: category_button.config(state=tk.NORMAL))
-            root.after(0, update_buttons_state)
+            product_df = df
+            ui_queue.put(('config', product_filename_label, {'text': f"Product File: {shorten_filename(file_path)}"}))
+            ui_queue.put(('config', status_label, {'text': "Product file loaded. Now select category file."}))
+            ui_queue.put(('config', category_button, {'state': tk.NORMAL}))
+            ui_queue.put(('call', update_buttons_state))
 
         except Exception as e:
-            root.after(0, lambda: [
-                messagebox.showerror("Product File Error", f"Failed to load product file:\n{e}"),
-                status_label.config(text="Error loading product file.")
-            ])
+            ui_queue.put(('error', "Product File Error", f"Failed to load product file:\n{e}"))
+            ui_queue.put(('config', status_label, {'text': "Error loading product file."}))
         finally:
-            root.after(0, lambda: [
-                progress_bar.stop(),
-                progress_bar.pack_forget()
-            ])
+            ui_queue.put(('call', hide_progress))
 
     threading.Thread(target=worker, daemon=True).start()
 
 def process_files():
-    if not product_file_path:
+    if product_df is None:
         messagebox.showwarning("No Product File", "Please select the product CSV file first.")
         return
     if not category_mapping:
@@ -276,7 +385,7 @@ def process_files():
     progress_bar.pack(fill='x', padx=20, pady=5)
     progress_bar.start()
 
-    threading.Thread(target=_process_file_worker, args=(product_file_path,), daemon=True).start()
+    threading.Thread(target=_process_file_worker, args=(product_df,), daemon=True).start()
 
 def save_file():
     global processed_df
@@ -288,7 +397,7 @@ def save_file():
         )
         if output_path:
             try:
-                processed_df.to_csv(output_path, index=False, encoding='utf-8-sig')
+                processed_df.to_csv(output_path, index=False, encoding='utf-8-sig', chunksize=50_000)
                 status_label.config(text="File saved successfully.")
                 messagebox.showinfo("Success", f"File saved to:\n{output_path}")
             except Exception as e:
@@ -324,4 +433,5 @@ progress_bar = ttk.Progressbar(root, mode='indeterminate')
 status_label = tk.Label(root, text="", fg="blue")
 status_label.pack(pady=5)
 
+root.after(50, drain_ui_queue)
 root.mainloop()